@@ -15,14 +15,41 @@ Usage:
     4. If not complete, blocks exit and feeds prompt back
     5. Repeat until done
 
-State is stored in ~/.ppds/ralph/{session_id}.json
+State is stored in ~/.ppds/ralph/{session_id}/ as two files:
+    config.json    - loop settings, written once and never rewritten
+    progress.json  - iteration counters and status, rewritten each fire
+~/.ppds/ralph/{session_id}.json is owned by the command that starts (and
+may later edit or cancel) the loop; the hook never modifies it. Whenever it
+is newer than config.json or progress.json, its fields replace that file.
 """
 import json
 import sys
 import os
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# Only this much of the transcript tail is read when checking for the promise.
+# The window doubles, up to MAX_TAIL_BYTES, while a line containing the
+# promise is cut off at its start.
+TAIL_BYTES = 64 * 1024
+MAX_TAIL_BYTES = 4 * 1024 * 1024
+
+# Cheap byte-level check that a transcript line could be an assistant message
+ASSISTANT_MARKERS = (b'"role":"assistant"', b'"role": "assistant"')
+
+# Mutable loop fields; everything else in the state is config
+PROGRESS_KEYS = (
+    "current_iteration", "last_iteration_at", "active", "completed_at", "exit_reason",
+)
+
+# Directories known to exist in this process
+_ready_dirs = set()
 
 
 def get_state_dir() -> Path:
@@ -31,28 +58,132 @@ def get_state_dir() -> Path:
 
 
 def get_state_file(session_id: str) -> Path:
-    """Get the state file for a specific session."""
+    """Get the single-file state written when a loop starts."""
     return get_state_dir() / f"{session_id}.json"
 
 
-def load_state(session_id: str) -> Optional[dict]:
-    """Load ralph loop state for a session. Returns None if no active loop."""
-    state_file = get_state_file(session_id)
-    if not state_file.exists():
+def get_session_dir(session_id: str) -> Path:
+    """Get the directory holding config.json and progress.json for a session."""
+    return get_state_dir() / session_id
+
+
+def write_json(path: Path, data: dict) -> None:
+    """
+    Write JSON compactly and atomically.
+
+    State is machine-read, so it is not pretty-printed. The write goes to a
+    temp file that replaces the real one, so a crash never leaves it torn.
+    """
+    if path.parent not in _ready_dirs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ready_dirs.add(path.parent)
+    tmp_file = path.with_suffix(".json.tmp")
+    tmp_file.write_text(
+        json.dumps(data, separators=(",", ":")), encoding="utf-8"
+    )
+    os.replace(tmp_file, path)
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
         return None
+
+
+def _is_stale(path: Path, source_mtime: float) -> bool:
+    """True if path is missing or older than the single-file state."""
+    mtime = _mtime(path)
+    return mtime is None or mtime < source_mtime
+
+
+def _write_best_effort(path: Path, data: dict) -> None:
+    """Write split state; a failure must not end an active loop."""
     try:
-        return json.loads(state_file.read_text(encoding="utf-8"))
+        write_json(path, data)
+    except OSError:
+        pass  # The next hook fire retries from the single-file state
+
+
+def load_state(session_id: str) -> Optional[Tuple[dict, dict]]:
+    """
+    Load ralph loop state for a session as (config, progress).
+
+    The single-file state is left in place for the command that owns it.
+    Its fields are taken for config.json or progress.json only when it was
+    written after that file, so the hook's own progress is not reset on
+    every fire. Returns None if there is no loop.
+    """
+    state_file = get_state_file(session_id)
+    session_dir = get_session_dir(session_id)
+    config_file = session_dir / "config.json"
+    progress_file = session_dir / "progress.json"
+
+    state = None
+    state_mtime = _mtime(state_file)
+    if state_mtime is not None:
+        try:
+            state = json.loads(state_file.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            state = None
+    if not isinstance(state, dict):
+        state = None
+
+    try:
+        if state is not None and _is_stale(config_file, state_mtime):
+            config = {k: v for k, v in state.items() if k not in PROGRESS_KEYS}
+            _write_best_effort(config_file, config)
+        else:
+            config = json.loads(config_file.read_text(encoding="utf-8"))
+
+        if state is not None and _is_stale(progress_file, state_mtime):
+            progress = {k: v for k, v in state.items() if k in PROGRESS_KEYS}
+            _write_best_effort(progress_file, progress)
+        else:
+            progress = json.loads(progress_file.read_text(encoding="utf-8"))
     except (json.JSONDecodeError, OSError):
         return None
+    if not isinstance(config, dict) or not isinstance(progress, dict):
+        return None
+    return config, progress
 
 
-def save_state(session_id: str, state: dict) -> None:
-    """Save ralph loop state for a session."""
-    state_dir = get_state_dir()
-    state_dir.mkdir(parents=True, exist_ok=True)
-    get_state_file(session_id).write_text(
-        json.dumps(state, indent=2), encoding="utf-8"
-    )
+def save_progress(session_id: str, progress: dict) -> None:
+    """Save the mutable part of a session's loop state."""
+    write_json(get_session_dir(session_id) / "progress.json", progress)
+
+
+def _scan_assistant_lines(lines: list, promise: str) -> Tuple[bool, int]:
+    """
+    Look for the promise in the newest assistant messages.
+
+    Walks the last 50 lines newest-first until 5 assistant messages have
+    been seen. Returns (promise found, assistant messages seen).
+    """
+    assistant_count = 0
+    for raw_line in reversed(lines[-50:]):
+        # Most lines are user/tool entries; skip them without parsing
+        if not any(marker in raw_line for marker in ASSISTANT_MARKERS):
+            continue
+        try:
+            entry = json_loads(raw_line.decode("utf-8", errors="replace"))
+        except ValueError:
+            continue
+        # Check for assistant role in message
+        if not isinstance(entry, dict) or entry.get("role") != "assistant":
+            continue
+        content = entry.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(
+                c.get("text", "") for c in content
+                if isinstance(c, dict) and c.get("type") == "text"
+            )
+        if promise in str(content):
+            return True, assistant_count
+        assistant_count += 1
+        if assistant_count >= 5:
+            break
+    return False, assistant_count
 
 
 def check_completion(transcript_path: Optional[str], promise: str) -> bool:
@@ -74,36 +205,36 @@ def check_completion(transcript_path: Optional[str], promise: str) -> bool:
         if not transcript_file.exists():
             return False
 
-        # Transcript is JSONL format (one JSON object per line)
-        lines = transcript_file.read_text(encoding="utf-8").strip().split("\n")
-
-        # Parse last 50 lines and look for assistant messages
-        recent_lines = lines[-50:] if len(lines) > 50 else lines
-        assistant_contents = []
-
-        for line in recent_lines:
-            if not line.strip():
-                continue
-            try:
-                entry = json.loads(line)
-                # Check for assistant role in message
-                if entry.get("role") == "assistant":
-                    content = entry.get("content", "")
-                    if isinstance(content, list):
-                        content = " ".join(
-                            c.get("text", "") for c in content
-                            if isinstance(c, dict) and c.get("type") == "text"
-                        )
-                    assistant_contents.append(str(content))
-            except json.JSONDecodeError:
-                continue
-
-        # Check last 5 assistant messages for the promise
-        for content in assistant_contents[-5:]:
-            if promise in content:
-                return True
-
-        return False
+        # Transcript is JSONL format (one JSON object per line). It grows
+        # for the whole loop, so read only a window from the end.
+        needles = {promise.encode("utf-8"), json.dumps(promise)[1:-1].encode("utf-8")}
+        window = TAIL_BYTES
+        with open(transcript_file, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            while True:
+                offset = max(0, size - window)
+                f.seek(offset)
+                tail = f.read()
+
+                # Usually the loop is not done yet: if the promise text (raw
+                # or JSON-escaped) is nowhere in the window, skip all parsing
+                if not any(needle in tail for needle in needles):
+                    return False
+
+                lines = tail.split(b"\n")
+                partial = b""
+                if offset > 0:
+                    partial = lines.pop(0)  # Likely cut off mid-record
+
+                found, assistant_count = _scan_assistant_lines(lines, promise)
+                if found:
+                    return True
+
+                # Only grow the window if the cut-off line could be the match
+                if (assistant_count >= 5 or offset == 0 or window >= MAX_TAIL_BYTES
+                        or not any(needle in partial for needle in needles)):
+                    return False
+                window *= 2
     except OSError:
         return False
 
@@ -130,18 +261,24 @@ def main():
     state = load_state(session_id)
 
     # No active loop? Allow exit silently
-    if not state or not state.get("active"):
+    if not state:
         sys.exit(0)
+    config, progress = state
+    if not progress.get("active"):
+        sys.exit(0)
+
+    # One timestamp per hook fire: every field set below describes this event
+    now_iso = datetime.now().isoformat()
 
     # Check max iterations
-    current = state.get("current_iteration", 0)
-    max_iter = state.get("max_iterations", 20)
+    current = progress.get("current_iteration", 0)
+    max_iter = config.get("max_iterations", 20)
 
     if current >= max_iter:
-        state["active"] = False
-        state["completed_at"] = datetime.now().isoformat()
-        state["exit_reason"] = "max_iterations_reached"
-        save_state(session_id, state)
+        progress["active"] = False
+        progress["completed_at"] = now_iso
+        progress["exit_reason"] = "max_iterations_reached"
+        save_progress(session_id, progress)
         # Output informational message but allow exit
         print(json.dumps({
             "reason": f"Ralph loop complete: max iterations ({max_iter}) reached"
@@ -150,28 +287,28 @@ def main():
 
     # Check completion promise
     transcript_path = hook_input.get("transcript_path")
-    promise = state.get("completion_promise", "")
+    promise = config.get("completion_promise", "")
 
     if promise and check_completion(transcript_path, promise):
-        state["active"] = False
-        state["completed_at"] = datetime.now().isoformat()
-        state["exit_reason"] = "completion_promise_found"
-        save_state(session_id, state)
+        progress["active"] = False
+        progress["completed_at"] = now_iso
+        progress["exit_reason"] = "completion_promise_found"
+        save_progress(session_id, progress)
         print(json.dumps({
             "reason": f"Ralph loop complete: found '{promise}'"
         }))
         sys.exit(0)
 
     # Continue the loop - increment iteration and block exit
-    state["current_iteration"] = current + 1
-    state["last_iteration_at"] = datetime.now().isoformat()
-    save_state(session_id, state)
+    progress["current_iteration"] = current + 1
+    progress["last_iteration_at"] = now_iso
+    save_progress(session_id, progress)
 
-    prompt = state.get("prompt", "Continue working on the task.")
+    prompt = config.get("prompt", "Continue working on the task.")
 
     result = {
         "decision": "block",
-        "reason": f"[Ralph {state['current_iteration']}/{max_iter}] {prompt}"
+        "reason": f"[Ralph {progress['current_iteration']}/{max_iter}] {prompt}"
     }
 
     print(json.dumps(result))